@@ -107,6 +107,18 @@ class Event:
         from quant.quant import quant
         SingleTask.run(quant.event_center.publish, self)
 
+    @classmethod
+    def publish_many(cls, events):
+        """ Publish a batch of events in one task, in order.
+
+        Args:
+            events: Event list.
+        """
+        if not events:
+            return
+        from quant.quant import quant
+        SingleTask.run(quant.event_center.publish_many, events)
+
     async def callback(self, channel, body, envelope, properties):
         self._exchange = envelope.exchange_name
         self._routing_key = envelope.routing_key
@@ -339,6 +351,23 @@ class EventCenter:
         data = event.dumps()
         await self._channel.basic_publish(payload=data, exchange_name=event.exchange, routing_key=event.routing_key)
 
+    async def publish_many(self, events):
+        """ Publish a batch of events.
+
+        Args:
+            events: Event list to publish, events are published in order.
+        """
+        if not self._connected:
+            logger.warn("RabbitMQ not ready right now!", caller=self)
+            return
+        for event in events:
+            try:
+                data = event.dumps()
+                await self._channel.basic_publish(payload=data, exchange_name=event.exchange,
+                                                  routing_key=event.routing_key)
+            except Exception as e:  # One failed event must not drop the rest of this batch.
+                logger.error("publish event error:", e, "event:", event, caller=self)
+
     async def connect(self, reconnect=False):
         """ Connect to RabbitMQ server and create default exchange.
 
@@ -56,6 +56,9 @@ class Order:
         utime: Order update time, millisecond.
     """
 
+    __slots__ = ("platform", "account", "strategy", "order_no", "client_order_id", "action", "order_type", "symbol",
+                 "price", "quantity", "remain", "status", "avg_price", "trade_type", "ctime", "utime")
+
     def __init__(self, account=None, platform=None, strategy=None, order_no=None, client_order_id=None, symbol=None,
                  action=None, price=0, quantity=0, remain=0, status=ORDER_STATUS_NONE, avg_price=0,
                  order_type=ORDER_TYPE_LIMIT, trade_type=TRADE_TYPE_NONE, ctime=None, utime=None):
@@ -76,6 +79,31 @@ class Order:
         self.ctime = ctime if ctime else tools.get_cur_timestamp_ms()
         self.utime = utime if utime else tools.get_cur_timestamp_ms()
 
+    def snapshot(self):
+        """ Get a copy of this order, e.g. pass to callback function, so that later updates of this order would not
+            change the copy.
+        """
+        order = Order.__new__(Order)
+        order.platform = self.platform
+        order.account = self.account
+        order.strategy = self.strategy
+        order.order_no = self.order_no
+        order.client_order_id = self.client_order_id
+        order.action = self.action
+        order.order_type = self.order_type
+        order.symbol = self.symbol
+        order.price = self.price
+        order.quantity = self.quantity
+        order.remain = self.remain
+        order.status = self.status
+        order.avg_price = self.avg_price
+        order.trade_type = self.trade_type
+        order.ctime = self.ctime
+        order.utime = self.utime
+        return order
+
+    __copy__ = snapshot  # Shallow copy without the generic `copy.copy` reduce protocol.
+
     def __str__(self):
         info = "[platform: {platform}, account: {account}, strategy: {strategy}, order_no: {order_no}, " \
                "client_order_id: {client_order_id}, action: {action}, symbol: {symbol}, price: {price}, " \
@@ -12,12 +12,9 @@ Email:  huangtao@ifclover.com
 import gzip
 import json
 import copy
-import hmac
-import base64
+import time
 import urllib
-import hashlib
-import datetime
-from urllib.parse import urljoin
+import functools
 
 from quant.error import Error
 from quant.order import Order
@@ -39,6 +36,52 @@ from quant.order import ORDER_STATUS_SUBMITTED, ORDER_STATUS_PARTIAL_FILLED, ORD
 
 __all__ = ("HuobiFutureRestAPI", "HuobiFutureTrade", )
 
+# Huobi Future order status -> order status.
+_STATUS_MAP = {
+    1: ORDER_STATUS_SUBMITTED,
+    2: ORDER_STATUS_SUBMITTED,
+    3: ORDER_STATUS_SUBMITTED,
+    4: ORDER_STATUS_PARTIAL_FILLED,
+    5: ORDER_STATUS_CANCELED,
+    6: ORDER_STATUS_FILLED,
+    7: ORDER_STATUS_CANCELED
+}
+# Huobi Future order status that remain quantity should be calculated by `trade_volume`.
+_REMAIN_STATUSES = {4, 5, 7}
+# (direction, offset) -> trade type.
+_TRADE_TYPE_MAP = {
+    ("buy", "open"): TRADE_TYPE_BUY_OPEN,
+    ("buy", "close"): TRADE_TYPE_BUY_CLOSE,
+    ("sell", "open"): TRADE_TYPE_SELL_OPEN,
+    ("sell", "close"): TRADE_TYPE_SELL_CLOSE
+}
+
+# HTTP request headers, shared by all requests and must not be modified.
+_GET_HEADERS = {
+    "Content-type": "application/x-www-form-urlencoded",
+    "User-Agent": "Mozilla/5.0 (Windows NT 6.1; WOW64) AppleWebKit/537.36 (KHTML, like Gecko) "
+                  "Chrome/39.0.2171.71 Safari/537.36"
+}
+_POST_HEADERS = {
+    "Accept": "application/json",
+    "Content-type": "application/json",
+    "User-Agent": "Mozilla/5.0 (Windows NT 6.1; WOW64; rv:53.0) Gecko/20100101 Firefox/53.0"
+}
+
+
+@functools.lru_cache(maxsize=128)
+def _signature_prefix(method, host_url, request_path):
+    """ Static head of signature payload, `method\nhost\npath\n`, only depends on the endpoint so it's cached."""
+    return "\n".join([method, host_url, request_path, ""])
+
+
+def _utc_timestamp():
+    """ Current UTC time string for signature, e.g. `2019-08-23T12:00:00`, same as
+        `datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S")` but without datetime object and strftime.
+    """
+    t = time.gmtime()
+    return "%04d-%02d-%02dT%02d:%02d:%02d" % (t.tm_year, t.tm_mon, t.tm_mday, t.tm_hour, t.tm_min, t.tm_sec)
+
 
 class HuobiFutureRestAPI:
     """ OKEx Swap REST API client.
@@ -52,9 +95,12 @@ class HuobiFutureRestAPI:
 
     def __init__(self, host, access_key, secret_key):
         """initialize REST API client."""
-        self._host = host
+        self._host = host.rstrip("/")
         self._access_key = access_key
         self._secret_key = secret_key
+        self._host_url = urllib.parse.urlparse(host).hostname.lower()
+        self._hmac = tools.HmacSha256(secret_key)
+        self._sig_static = (("AccessKeyId", access_key), ("SignatureMethod", "HmacSHA256"), ("SignatureVersion", "2"))
 
     async def get_contract_info(self, symbol=None, contract_type=None, contract_code=None):
         """ Get contract information.
@@ -173,7 +219,6 @@ class HuobiFutureRestAPI:
             success: Success results, otherwise it's None.
             error: Error information, otherwise it's None.
         """
-        uri = "/api/v1/contract_order"
         body = {
             "symbol": symbol,
             "contract_type": contract_type,
@@ -185,6 +230,22 @@ class HuobiFutureRestAPI:
             "lever_rate": lever_rate,
             "order_price_type": order_price_type
         }
+        success, error = await self.create_order_raw(body)
+        return success, error
+
+    async def create_order_raw(self, body):
+        """ Create an new order with a prepared request body.
+
+        Args:
+            body: Order request body, including all the fields described in `create_order`, e.g.
+                {"symbol": "BTC", "contract_type": "this_week", "contract_code": "BTC180914", "price": 3000,
+                 "volume": 1, "direction": "buy", "offset": "open", "lever_rate": 20, "order_price_type": "limit"}
+
+        Returns:
+            success: Success results, otherwise it's None.
+            error: Error information, otherwise it's None.
+        """
+        uri = "/api/v1/contract_order"
         success, error = await self.request("POST", uri, body=body, auth=True)
         return success, error
 
@@ -221,7 +282,7 @@ class HuobiFutureRestAPI:
         uri = "/api/v1/contract_cancel"
         body = {
             "symbol": symbol,
-            "order_id": ",".join(order_ids)
+            "order_id": ",".join(map(str, order_ids))
         }
         success, error = await self.request("POST", uri, body=body, auth=True)
         return success, error
@@ -266,7 +327,7 @@ class HuobiFutureRestAPI:
         uri = "/api/v1/contract_order_info"
         body = {
             "symbol": symbol,
-            "order_id": ",".join(order_ids)
+            "order_id": ",".join(map(str, order_ids))
         }
         success, error = await self.request("POST", uri, body=body, auth=True)
         return success, error
@@ -307,29 +368,21 @@ class HuobiFutureRestAPI:
             success: Success results, otherwise it's None.
             error: Error information, otherwise it's None.
         """
-        url = urljoin(self._host, uri)
+        url = self._host + uri  # `uri` always starts with "/".
 
         if auth:
-            timestamp = datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S")
-            params = params if params else {}
-            params.update({"AccessKeyId": self._access_key,
-                           "SignatureMethod": "HmacSHA256",
-                           "SignatureVersion": "2",
-                           "Timestamp": timestamp})
+            timestamp = _utc_timestamp()
+            params = dict(params) if params else {}
+            params.update(self._sig_static)
+            params["Timestamp"] = timestamp
 
             params["Signature"] = self.generate_signature(method, params, uri)
 
-        if not headers:
-            headers = {}
         if method == "GET":
-            headers["Content-type"] = "application/x-www-form-urlencoded"
-            headers["User-Agent"] = "Mozilla/5.0 (Windows NT 6.1; WOW64) AppleWebKit/537.36 (KHTML, like Gecko) " \
-                                    "Chrome/39.0.2171.71 Safari/537.36"
+            headers = {**headers, **_GET_HEADERS} if headers else _GET_HEADERS
             _, success, error = await AsyncHttpRequests.fetch("GET", url, params=params, headers=headers, timeout=10)
         else:
-            headers["Accept"] = "application/json"
-            headers["Content-type"] = "application/json"
-            headers["User-Agent"] = "Mozilla/5.0 (Windows NT 6.1; WOW64; rv:53.0) Gecko/20100101 Firefox/53.0"
+            headers = {**headers, **_POST_HEADERS} if headers else _POST_HEADERS
             _, success, error = await AsyncHttpRequests.fetch("POST", url, params=params, data=body, headers=headers,
                                                               timeout=10)
         if error:
@@ -343,17 +396,10 @@ class HuobiFutureRestAPI:
         return result, None
 
     def generate_signature(self, method, params, request_path):
-        host_url = urllib.parse.urlparse(self._host).hostname.lower()
-        sorted_params = sorted(params.items(), key=lambda d: d[0], reverse=False)
+        sorted_params = sorted(params.items())  # Keys are unique, so tuples sort by key only.
         encode_params = urllib.parse.urlencode(sorted_params)
-        payload = [method, host_url, request_path, encode_params]
-        payload = "\n".join(payload)
-        payload = payload.encode(encoding="UTF8")
-        secret_key = self._secret_key.encode(encoding="utf8")
-        digest = hmac.new(secret_key, payload, digestmod=hashlib.sha256).digest()
-        signature = base64.b64encode(digest)
-        signature = signature.decode()
-        return signature
+        payload = _signature_prefix(method, self._host_url, request_path) + encode_params
+        return self._hmac.b64digest(payload)
 
 
 class HuobiFutureTrade:
@@ -428,7 +474,7 @@ class HuobiFutureTrade:
         self._ws.initialize()
 
         self._assets = {}  # Asset detail, {"BTC": {"free": "1.1", "locked": "2.2", "total": "3.3"}, ... }.
-        self._orders = {}  # Order objects, {"order_id": order, ...}.
+        self._orders = {}  # Order objects, keyed by integer order id, {order_id: order, ...}.
         self._position = Position(self._platform, self._account, self._strategy, self._contract_code)
 
         self._order_channel = "orders.{symbol}".format(symbol=self._symbol.lower())
@@ -437,6 +483,21 @@ class HuobiFutureTrade:
         self._subscribe_order_ok = False
         self._subscribe_position_ok = False
 
+        # Websocket message handlers, {"op": handler, ... }.
+        self._op_handlers = {
+            "notify": self._on_notify,
+            "auth": self.auth_callback,
+            "sub": self.sub_callback
+        }
+
+        # Order fields that never change for this Trade object, copied into each create order request body.
+        self._order_body_template = {
+            "symbol": self._symbol,
+            "contract_type": self._contract_type,
+            "contract_code": self._contract_code,
+            "lever_rate": 20
+        }
+
         self._rest_api = HuobiFutureRestAPI(self._host, self._access_key, self._secret_key)
 
         # Subscribe AssetEvent.
@@ -449,7 +510,7 @@ class HuobiFutureTrade:
 
     @property
     def orders(self):
-        return copy.copy(self._orders)
+        return {order.order_no: order for order in self._orders.values()}
 
     @property
     def position(self):
@@ -461,7 +522,7 @@ class HuobiFutureTrade:
 
     async def connected_callback(self):
         """After connect to Websocket server successfully, send a auth message to server."""
-        timestamp = datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S")
+        timestamp = _utc_timestamp()
         data = {
             "AccessKeyId": self._access_key,
             "SignatureMethod": "HmacSHA256",
@@ -517,7 +578,6 @@ class HuobiFutureTrade:
                 self._update_order(order_info)
             SingleTask.run(self._init_success_callback, True, None)
 
-    @async_method_locker("HuobiFutureTrade.process_binary.locker")
     async def process_binary(self, raw):
         """ 处理websocket上接收到的消息
         @param raw 原始的压缩数据
@@ -525,24 +585,38 @@ class HuobiFutureTrade:
         data = json.loads(gzip.decompress(raw).decode())
         logger.debug("data:", data, caller=self)
 
-        op = data.get("op")
-        if op == "ping":
-            hb_msg = {"op": "pong", "ts": data.get("ts")}
-            await self._ws.send(hb_msg)
+        # Heartbeat doesn't touch any state, so reply immediately without waiting for the locker.
+        if data.get("op") == "ping":
+            await self._on_ping(data)
+            return
+        await self._process_binary_locked(data)
 
-        elif op == "auth":
-            await self.auth_callback(data)
+    @async_method_locker("HuobiFutureTrade.process_binary.locker")
+    async def _process_binary_locked(self, data):
+        """ Process auth/sub/notify messages, serialized by locker.
 
-        elif op == "sub":
-            await self.sub_callback(data)
+        Every frame is handled in its own task, so the locker keeps notify messages from being applied while
+        `sub_callback` is waiting for the open orders snapshot.
 
-        elif op == "notify":
-            if data["topic"] == self._order_channel:
-                self._update_order(data)
-            elif data["topic"] == "positions":
-                self._update_position(data)
-            elif data["topic"] == self._position_channel:
-                self._update_position(data)
+        Args:
+            data: Decoded websocket message.
+        """
+        handler = self._op_handlers.get(data.get("op"))
+        if handler:
+            await handler(data)
+
+    async def _on_ping(self, data):
+        """Reply heartbeat message."""
+        hb_msg = {"op": "pong", "ts": data.get("ts")}
+        await self._ws.send(hb_msg)
+
+    async def _on_notify(self, data):
+        """Route order and position notification by topic."""
+        topic = data["topic"]
+        if topic == self._order_channel:
+            self._update_order(data)
+        elif topic == self._position_channel or topic == "positions":
+            self._update_position(data)
 
     async def create_order(self, action, price, quantity, order_type=ORDER_TYPE_LIMIT, *args, **kwargs):
         """ Create an order.
@@ -578,7 +652,6 @@ class HuobiFutureTrade:
             else:
                 return None, "action error"
 
-        lever_rate = kwargs.get("lever_rate", 20)
         if order_type == ORDER_TYPE_LIMIT:
             order_price_type = "limit"
         elif order_type == ORDER_TYPE_MARKET:
@@ -586,10 +659,12 @@ class HuobiFutureTrade:
         else:
             return None, "order type error"
 
-        quantity = abs(int(quantity))
-        result, error = await self._rest_api.create_order(self._symbol, self._contract_type, self._contract_code,
-                                                          price, quantity, direction, offset, lever_rate,
-                                                          order_price_type)
+        body = self._order_body_template.copy()
+        body.update(price=price, volume=abs(int(quantity)), direction=direction, offset=offset,
+                    order_price_type=order_price_type)
+        if "lever_rate" in kwargs:
+            body["lever_rate"] = kwargs["lever_rate"]
+        result, error = await self._rest_api.create_order_raw(body)
         if error:
             return None, error
         return str(result["data"]["order_id"]), None
@@ -647,11 +722,8 @@ class HuobiFutureTrade:
         if error:
             return None, error
         else:
-            order_nos = []
-            for order_info in success["data"]["orders"]:
-                if order_info["contract_code"] != self._contract_code:
-                    continue
-                order_nos.append(str(order_info["order_id"]))
+            order_nos = [str(order_info["order_id"]) for order_info in success["data"]["orders"]
+                         if order_info["contract_code"] == self._contract_code]
             return order_nos, None
 
     def _update_order(self, order_info):
@@ -662,27 +734,17 @@ class HuobiFutureTrade:
         """
         if order_info["contract_code"] != self._contract_code:
             return
-        order_no = str(order_info["order_id"])
+        order_id = int(order_info["order_id"])
         status = order_info["status"]
 
-        order = self._orders.get(order_no)
+        order = self._orders.get(order_id)
         if not order:
-            if order_info["direction"] == "buy":
-                if order_info["offset"] == "open":
-                    trade_type = TRADE_TYPE_BUY_OPEN
-                else:
-                    trade_type = TRADE_TYPE_BUY_CLOSE
-            else:
-                if order_info["offset"] == "close":
-                    trade_type = TRADE_TYPE_SELL_CLOSE
-                else:
-                    trade_type = TRADE_TYPE_SELL_OPEN
-
+            trade_type = _TRADE_TYPE_MAP[(order_info["direction"], order_info["offset"])]
             info = {
                 "platform": self._platform,
                 "account": self._account,
                 "strategy": self._strategy,
-                "order_no": order_no,
+                "order_no": str(order_id),
                 "action": ORDER_ACTION_BUY if order_info["direction"] == "buy" else ORDER_ACTION_SELL,
                 "symbol": self._contract_code,
                 "price": order_info["price"],
@@ -690,21 +752,16 @@ class HuobiFutureTrade:
                 "trade_type": trade_type
             }
             order = Order(**info)
-            self._orders[order_no] = order
+            self._orders[order_id] = order
 
-        if status in [1, 2, 3]:
-            order.status = ORDER_STATUS_SUBMITTED
-        elif status == 4:
-            order.status = ORDER_STATUS_PARTIAL_FILLED
+        new_status = _STATUS_MAP.get(status)
+        if new_status is None:
+            return
+        order.status = new_status
+        if status in _REMAIN_STATUSES:
             order.remain = int(order.quantity) - int(order_info["trade_volume"])
         elif status == 6:
-            order.status = ORDER_STATUS_FILLED
             order.remain = 0
-        elif status in [5, 7]:
-            order.status = ORDER_STATUS_CANCELED
-            order.remain = int(order.quantity) - int(order_info["trade_volume"])
-        else:
-            return
 
         order.avg_price = order_info["trade_avg_price"]
         order.ctime = order_info["created_at"]
@@ -714,7 +771,7 @@ class HuobiFutureTrade:
 
         # Delete order that already completed.
         if order.status in [ORDER_STATUS_FAILED, ORDER_STATUS_CANCELED, ORDER_STATUS_FILLED]:
-            self._orders.pop(order_no)
+            self._orders.pop(order_id)
 
     def _update_position(self, data):
         """ Position update.
@@ -725,9 +782,10 @@ class HuobiFutureTrade:
         Returns:
             None.
         """
+        updated = False
         for position_info in data["data"]:
             if position_info["contract_code"] != self._contract_code:
-                return
+                continue
             if position_info["direction"] == "buy":
                 self._position.long_quantity = int(position_info["volume"])
                 self._position.long_avg_price = position_info["cost_hold"]
@@ -735,6 +793,9 @@ class HuobiFutureTrade:
                 self._position.short_quantity = int(position_info["volume"])
                 self._position.short_avg_price = position_info["cost_hold"]
             # self._position.liquid_price = None
+            updated = True
+        # Merge all rows of this message first, then callback only once.
+        if updated:
             self._position.utime = data["ts"]
             SingleTask.run(self._position_update_callback, copy.copy(self._position))
 
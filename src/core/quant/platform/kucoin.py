@@ -11,20 +11,22 @@ Email:  huangtao@ifclover.com
 
 import json
 import copy
-import hmac
-import base64
-import hashlib
-from urllib.parse import urljoin
+import time
+import asyncio
+import collections
+from decimal import Decimal
+from types import MappingProxyType
+from urllib.parse import urljoin, urlencode
 
 from quant.error import Error
 from quant.utils import tools
 from quant.utils import logger
 from quant.const import KUCOIN
 from quant.order import Order
+from quant.utils.web import Websocket
 from quant.asset import Asset, AssetSubscribe
 from quant.tasks import SingleTask, LoopRunTask
 from quant.utils.http_client import AsyncHttpRequests
-from quant.utils.decorator import async_method_locker
 from quant.order import ORDER_TYPE_LIMIT, ORDER_TYPE_MARKET
 from quant.order import ORDER_ACTION_BUY, ORDER_ACTION_SELL
 from quant.order import ORDER_STATUS_SUBMITTED, ORDER_STATUS_PARTIAL_FILLED, ORDER_STATUS_FILLED, \
@@ -33,6 +35,71 @@ from quant.order import ORDER_STATUS_SUBMITTED, ORDER_STATUS_PARTIAL_FILLED, ORD
 
 __all__ = ("KucoinRestAPI", "KucoinTrade", )
 
+# Headers for requests with JSON body, shared by all requests and must not be modified.
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+
+class _ConcurrencyController:
+    """ AIMD(additive-increase/multiplicative-decrease) controller for concurrent HTTP requests.
+
+    Attributes:
+        max_limit: Maximum concurrent requests.
+        min_limit: Minimum concurrent requests.
+
+    * NOTE: Concurrency increases by 0.5 after each request the server handled, and halves on HTTP 429/5xx or
+            connection error. Slow requests alone are not treated as overload.
+    """
+
+    def __init__(self, max_limit, min_limit=1):
+        """Initialize."""
+        self._min_limit = min_limit
+        self._max_limit = max_limit
+        self._limit = max_limit
+        self._running = 0
+        self._condition = asyncio.Condition()
+
+    async def acquire(self):
+        """Wait until a new request is allowed."""
+        async with self._condition:
+            while self._running >= int(self._limit):
+                await self._condition.wait()
+            self._running += 1
+
+    async def release(self, overloaded=False):
+        """ Release after a request finished, and adjust concurrency limit.
+
+        Args:
+            overloaded: If server is overloaded, e.g. HTTP 429/5xx or connection error.
+        """
+        async with self._condition:
+            self._running -= 1
+            if overloaded:
+                self._limit = max(self._min_limit, self._limit * 0.5)
+            else:
+                self._limit = min(self._max_limit, self._limit + 0.5)
+            self._condition.notify_all()
+
+
+class _PrivateWebsocket(Websocket):
+    """ Private Websocket connection, the token in connection url expires, so a new url is fetched before every
+    re-connection.
+
+    Attributes:
+        url_callback: Asynchronous callback function that returns a new connection url, or None if failed.
+    """
+
+    def __init__(self, url, url_callback, connected_callback=None, process_callback=None):
+        """Initialize."""
+        self._url_callback = url_callback
+        super(_PrivateWebsocket, self).__init__(url, connected_callback, process_callback=process_callback)
+
+    async def _reconnect(self):
+        """Re-connect to Websocket server with a new token."""
+        url = await self._url_callback()
+        if url:
+            self._url = url
+        await super(_PrivateWebsocket, self)._reconnect()
+
 
 class KucoinRestAPI:
     """ Kucoin REST API client.
@@ -42,14 +109,29 @@ class KucoinRestAPI:
         access_key: Account"s ACCESS KEY.
         secret_key: Account"s SECRET KEY.
         passphrase: API KEY passphrase.
+        rate_limit: Max requests per minute, requests over the limit will wait in sliding window until they're allowed.
+            default is None, no limit.
+        max_concurrency: Max concurrent requests, the limit halves on HTTP 429/5xx or connection error and grows back
+            after requests succeed. default is None, no limit.
     """
 
-    def __init__(self, host, access_key, secret_key, passphrase):
+    def __init__(self, host, access_key, secret_key, passphrase, rate_limit=None, max_concurrency=None):
         """initialize REST API client."""
         self._host = host
         self._access_key = access_key
         self._secret_key = secret_key
         self._passphrase = passphrase
+        self._rate_limit = rate_limit
+        self._request_times = collections.deque()  # Timestamps of requests sent in last 60 seconds.
+        self._concurrency = _ConcurrencyController(max_concurrency) if max_concurrency else None
+
+        # Static authentication headers, only signature and timestamp are added per request.
+        self._auth_headers = {
+            "KC-API-KEY": access_key,
+            "KC-API-PASSPHRASE": passphrase
+        }
+        self._auth_json_headers = {**self._auth_headers, **_JSON_HEADERS}
+        self._hmac = tools.HmacSha256(secret_key)
 
     async def get_sub_users(self):
         """Get the user info of all sub-users via this interface.
@@ -92,7 +174,7 @@ class KucoinRestAPI:
             success: Success results, otherwise it"s None.
             error: Error information, otherwise it"s None.
         """
-        uri = "/api/v1/accounts/{}".format(account_id)
+        uri = "/api/v1/accounts/" + account_id
         success, error = await self.request("GET", uri, auth=True)
         return success, error
 
@@ -152,7 +234,7 @@ class KucoinRestAPI:
             success: Success results, otherwise it"s None.
             error: Error information, otherwise it"s None.
         """
-        uri = "/api/v1/orders/{}".format(order_id)
+        uri = "/api/v1/orders/" + order_id
         success, error = await self.request("DELETE", uri, auth=True)
         return success, error
 
@@ -212,7 +294,7 @@ class KucoinRestAPI:
             success: Success results, otherwise it"s None.
             error: Error information, otherwise it"s None.
         """
-        uri = "/api/v1/orders/{}".format(order_id)
+        uri = "/api/v1/orders/" + order_id
         success, error = await self.request("GET", uri, auth=True)
         return success, error
 
@@ -246,9 +328,9 @@ class KucoinRestAPI:
             error: Error information, otherwise it"s None.
         """
         if count == 20:
-            uri = "/api/v1/market/orderbook/level2_20?symbol={}".format(symbol)
+            uri = "/api/v1/market/orderbook/level2_20?symbol=" + symbol
         else:
-            uri = "/api/v2/market/orderbook/level2_100?symbol={}".format(symbol)
+            uri = "/api/v2/market/orderbook/level2_100?symbol=" + symbol
         success, error = await self.request("GET", uri)
         return success, error
 
@@ -267,32 +349,72 @@ class KucoinRestAPI:
             success: Success results, otherwise it"s None.
             error: Error information, otherwise it"s None.
         """
+        await self._wait_if_throttled()
         if params:
-            query = "&".join(["{}={}".format(k, params[k]) for k in sorted(params.keys())])
-            uri += "?" + query
+            uri += "?" + urlencode(sorted(params.items()))
         url = urljoin(self._host, uri)
-        if auth:
-            if not headers:
-                headers = {}
-            timestamp = str(tools.get_cur_timestamp_ms())
-            signature = self._generate_signature(timestamp, method, uri, body)
-            headers["KC-API-KEY"] = self._access_key
-            headers["KC-API-SIGN"] = signature
-            headers["KC-API-TIMESTAMP"] = timestamp
-            headers["KC-API-PASSPHRASE"] = self._passphrase
-        _, success, error = await AsyncHttpRequests.fetch(method, url, data=body, headers=headers, timeout=10)
+        # Serialize once, the same compact string is signed and sent.
+        body = json.dumps(body, separators=(",", ":")) if body else None
+        if self._concurrency:
+            await self._concurrency.acquire()
+            code = None
+            try:
+                code, success, error = await self._send(method, url, uri, body, headers, auth)
+            finally:
+                overloaded = code is None or code == 429 or code >= 500
+                await self._concurrency.release(overloaded)
+        else:
+            code, success, error = await self._send(method, url, uri, body, headers, auth)
         if error:
             return None, error
         if success["code"] != "200000":
             return None, success
         return success["data"], error
 
-    def _generate_signature(self, nonce, method, path, data):
-        """Generate the call signature."""
-        data = json.dumps(data) if data else ""
-        sig_str = "{}{}{}{}".format(nonce, method, path, data)
-        m = hmac.new(self._secret_key.encode("utf-8"), sig_str.encode("utf-8"), hashlib.sha256)
-        return base64.b64encode(m.digest()).decode("utf-8")
+    async def _send(self, method, url, uri, body, headers, auth):
+        """ Sign (if `auth`) and send a request, the timestamp is taken right before sending.
+
+        Returns:
+            code: HTTP response code.
+            success: HTTP response data.
+            error: Error information.
+        """
+        if auth:
+            timestamp = str(tools.get_cur_timestamp_ms())
+            signature = self._generate_signature(timestamp, method, uri, body)
+            base_headers = self._auth_json_headers if body else self._auth_headers
+            if headers:
+                headers = {**headers, **base_headers, "KC-API-SIGN": signature, "KC-API-TIMESTAMP": timestamp}
+            else:
+                headers = {**base_headers, "KC-API-SIGN": signature, "KC-API-TIMESTAMP": timestamp}
+        elif body:
+            headers = {**headers, **_JSON_HEADERS} if headers else _JSON_HEADERS
+        return await AsyncHttpRequests.fetch(method, url, body=body, headers=headers, timeout=10)
+
+    async def _wait_if_throttled(self):
+        """ Wait until sending a new request will not exceed `rate_limit` in the sliding window of 60 seconds."""
+        if not self._rate_limit:
+            return
+        while True:
+            now = time.time()
+            while self._request_times and now - self._request_times[0] >= 60:
+                self._request_times.popleft()
+            if len(self._request_times) < self._rate_limit:
+                break
+            await asyncio.sleep(60 - (now - self._request_times[0]))
+        self._request_times.append(now)
+
+    def _generate_signature(self, nonce, method, path, body):
+        """ Generate the call signature.
+
+        Args:
+            nonce: Timestamp string in milliseconds.
+            method: HTTP request method.
+            path: HTTP request uri, including query string.
+            body: JSON serialized request body, or None.
+        """
+        sig_str = nonce + method + path + body if body else nonce + method + path
+        return self._hmac.b64digest(sig_str)
 
 
 class KucoinTrade:
@@ -315,7 +437,13 @@ class KucoinTrade:
         init_success_callback: You can use this param to specific a async callback function when you initializing Trade
             object. `init_success_callback` is like `async def on_init_success_callback(success: bool, error: Error, **kwargs): pass`
             and this callback function will be executed asynchronous after Trade module object initialized successfully.
-        check_order_interval: The interval time(seconds) for loop run task to check order status. (default is 2 seconds)
+        check_order_interval: The interval time(seconds) for loop task to check order status. (default is 2 seconds)
+            Order status is pushed by private Websocket channel, this loop task only polls when Websocket
+            subscription is not available, and it backs off when there is no open order.
+        rate_limit: Max REST API requests per minute, requests will wait before sending if over the limit. (default is
+            None, no limit)
+        max_concurrency: Max concurrent REST API requests, it halves when server is overloaded and grows back after
+            requests succeed. (default is None, no limit)
     """
 
     def __init__(self, **kwargs):
@@ -353,17 +481,24 @@ class KucoinTrade:
         self._order_update_callback = kwargs.get("order_update_callback")
         self._init_success_callback = kwargs.get("init_success_callback")
         self._check_order_interval = kwargs.get("check_order_interval", 2)
+        self._rate_limit = kwargs.get("rate_limit")
+        self._max_concurrency = kwargs.get("max_concurrency")
 
         self._raw_symbol = self._symbol.replace("/", "-")  # Raw symbol name.
 
         self._assets = {}  # Asset information. e.g. {"BTC": {"free": "1.1", "locked": "2.2", "total": "3.3"}, ... }
         self._orders = {}  # Order details. e.g. {order_no: order-object, ... }
+        self._order_sigs = {}  # Last (dealSize, isActive, size) of each order. e.g. {order_no: ("0", True, "1"), ... }
+
+        self._ws = None  # Private Websocket connection object.
+        self._ws_subscribed = False  # If order channel is subscribed successfully.
 
         # Initialize our REST API client.
-        self._rest_api = KucoinRestAPI(self._host, self._access_key, self._secret_key, self._passphrase)
+        self._rest_api = KucoinRestAPI(self._host, self._access_key, self._secret_key, self._passphrase,
+                                       self._rate_limit, self._max_concurrency)
 
-        # Create a loop run task to check order status.
-        LoopRunTask.register(self._check_order_update, self._check_order_interval)
+        # Create a loop task to check order status.
+        SingleTask.run(self._order_refresh_loop)
 
         # Subscribe asset event.
         if self._asset_update_callback:
@@ -377,7 +512,8 @@ class KucoinTrade:
 
     @property
     def orders(self):
-        return copy.copy(self._orders)
+        """Read-only view of current orders, it's updated in place, so DO NOT modify it."""
+        return MappingProxyType(self._orders)
 
     @property
     def rest_api(self):
@@ -396,9 +532,99 @@ class KucoinTrade:
             if item["symbol"] != self._raw_symbol:
                 continue
             await self._update_order(item)
+
+        # Create private Websocket connection to receive order update, otherwise fall back to polling.
+        url, server = await self._get_ws_url()
+        if url:
+            self._ws = _PrivateWebsocket(url, self._get_ws_reconnect_url, self._ws_connected_callback,
+                                         process_callback=self._process_ws)
+            self._ws.initialize()
+            ping_interval = max(int(server.get("pingInterval", 30000) / 1000), 1)  # Heartbeat counts whole seconds.
+            LoopRunTask.register(self._send_heartbeat_msg, ping_interval)
+
         if self._init_success_callback:
             SingleTask.run(self._init_success_callback, True, None)
 
+    async def _get_ws_url(self):
+        """ Get a new private Websocket token.
+
+        Returns:
+            url: Websocket connection url with token, or None if failed.
+            server: Websocket server information, or None if failed.
+        """
+        success, error = await self._rest_api.get_websocket_token(private=True)
+        if error:
+            logger.error("get private websocket token error:", error, caller=self)
+            return None, None
+        server = success["instanceServers"][0]
+        url = "{}?token={}".format(server["endpoint"], success["token"])
+        return url, server
+
+    async def _get_ws_reconnect_url(self):
+        """Get a new private Websocket url before re-connection."""
+        url, _ = await self._get_ws_url()
+        return url
+
+    async def _ws_connected_callback(self):
+        """After connect to Websocket server successfully, subscribe order channel."""
+        self._ws_subscribed = False
+        data = {
+            "id": tools.get_uuid1(),
+            "type": "subscribe",
+            "topic": "/spotMarket/tradeOrders",
+            "privateChannel": True,
+            "response": True
+        }
+        await self._ws.send(data)
+
+    async def _send_heartbeat_msg(self, *args, **kwargs):
+        """Send ping message to keep Websocket connection alive."""
+        if not self._ws.ws:
+            return
+        data = {
+            "id": tools.get_uuid1(),
+            "type": "ping"
+        }
+        await self._ws.send(data)
+
+    async def _process_ws(self, msg):
+        """ Process message that received from Websocket connection.
+
+        Args:
+            msg: Message received from Websocket connection.
+        """
+        logger.debug("msg:", msg, caller=self)
+        if not isinstance(msg, dict):
+            return
+        msg_type = msg.get("type")
+        if msg_type == "ack":
+            self._ws_subscribed = True
+            logger.info("subscribe order channel success.", caller=self)
+        elif msg_type == "message" and msg.get("topic") == "/spotMarket/tradeOrders":
+            data = msg["data"]
+            if data.get("symbol") != self._raw_symbol:
+                return
+            # Some messages have no `size` or `filledSize`, e.g. type `received`, or market order placed by funds,
+            # skip them and leave the order to be updated by REST API polling.
+            size = data.get("size")
+            deal_size = data.get("filledSize")
+            if size is None or deal_size is None:
+                return
+            order_time = data.get("orderTime")
+            # Convert to the same format as REST API order information.
+            order_info = {
+                "id": data["orderId"],
+                "side": data["side"],
+                "price": data.get("price"),
+                "size": size,
+                "dealSize": deal_size,
+                "isActive": data.get("status") != "done",
+                "createdAt": int(order_time / 1000000) if order_time else tools.get_cur_timestamp_ms()  # ns to ms.
+            }
+            await self._update_order(order_info)
+        elif msg_type == "error":
+            logger.error("websocket error:", msg, caller=self)
+
     async def create_order(self, action, price, quantity, order_type=ORDER_TYPE_LIMIT, *args, **kwargs):
         """ Create an order.
 
@@ -447,7 +673,7 @@ class KucoinTrade:
         order = Order(**infos)
         self._orders[order_no] = order
         if self._order_update_callback:
-            SingleTask.run(self._order_update_callback, copy.copy(order))
+            SingleTask.run(self._order_update_callback, order.snapshot())
         return order_no, None
 
     async def revoke_order(self, *order_nos):
@@ -479,8 +705,13 @@ class KucoinTrade:
         # If len(order_nos) > 1, you will cancel multiple orders.
         if len(order_nos) > 1:
             s, e, = [], []
-            for order_no in order_nos:
-                success, error = await self._rest_api.revoke_order(order_no)
+            results = await asyncio.gather(*(self._rest_api.revoke_order(order_no) for order_no in order_nos),
+                                           return_exceptions=True)
+            for order_no, result in zip(order_nos, results):
+                if isinstance(result, Exception):
+                    e.append(result)
+                    continue
+                success, error = result
                 if error:
                     e.append(error)
                 else:
@@ -507,31 +738,77 @@ class KucoinTrade:
             order_nos.append(item["id"])
         return order_nos, None
 
+    async def _order_refresh_loop(self):
+        """ Check order status every `check_order_interval` seconds while there are open orders. If no open order,
+            the sleep time doubles after each idle check, up to 4 times of `check_order_interval` (no more than 30
+            seconds unless `check_order_interval` is longer).
+        """
+        max_idle_interval = max(self._check_order_interval, min(self._check_order_interval * 4, 30))
+        idle_interval = self._check_order_interval
+        while True:
+            if not self._orders:
+                await asyncio.sleep(idle_interval)
+                idle_interval = min(idle_interval * 2, max_idle_interval)
+                continue
+            idle_interval = self._check_order_interval
+            try:
+                await self._check_order_update()
+            except Exception as e:
+                logger.exception("check order update error:", e, caller=self)
+            await asyncio.sleep(self._check_order_interval)
+
     async def _check_order_update(self, *args, **kwargs):
         """ Loop run task for check order status.
         """
-        order_nos = list(self._orders.keys())
-        if not order_nos:
+        if not self._orders:
+            return
+        if self._ws_subscribed and self._ws.ws and not self._ws.ws.closed:
+            return
+
+        # Fetch all active orders in one request.
+        result, error = await self._rest_api.get_order_list(symbol=self._raw_symbol)
+        if error:
             return
-        for order_no in order_nos:
-            success, error = await self._rest_api.get_order_detail(order_no)
+        active_order_nos = set()
+        for item in result["items"]:
+            if item["symbol"] != self._raw_symbol:
+                continue
+            active_order_nos.add(item["id"])
+            await self._update_order(item)
+
+        # Orders not in active list were completed or canceled, fetch their final state one by one.
+        order_nos = tuple(self._orders.keys() - active_order_nos)
+        results = await asyncio.gather(*(self._rest_api.get_order_detail(order_no) for order_no in order_nos),
+                                       return_exceptions=True)
+        for result in results:
+            if isinstance(result, Exception):
+                continue
+            success, error = result
             if error:
-                return
+                continue
             await self._update_order(success)
 
-    @async_method_locker("KucoinTrade.order.locker")
     async def _update_order(self, order_info):
         """ Update order object.
 
         Args:
             order_info: Order information.
+
+        * NOTE: There is no `await` in this method, so updating `self._orders` can not be interleaved by other
+                coroutines and no locker is needed.
         """
         if not order_info:
             return
 
         order_no = order_info["id"]
-        size = float(order_info["size"])
-        deal_size = float(order_info["dealSize"])
+        # Skip if nothing changed since last update of this order.
+        order_sig = (order_info["dealSize"], order_info["isActive"], order_info["size"])
+        if order_no in self._orders and self._order_sigs.get(order_no) == order_sig:
+            return
+        self._order_sigs[order_no] = order_sig
+
+        size = Decimal(order_info["size"])
+        deal_size = Decimal(order_info["dealSize"])
         order = self._orders.get(order_no)
         if not order:
             info = {
@@ -562,14 +839,15 @@ class KucoinTrade:
 
         if status != order.status:
             order.status = status
-            order.remain = size - deal_size
+            order.remain = float(size - deal_size)
             order.ctime = order_info["createdAt"]
             order.utime = tools.get_cur_timestamp_ms()
-            SingleTask.run(self._order_update_callback, copy.copy(order))
+            SingleTask.run(self._order_update_callback, order.snapshot())
 
         # Delete order that already completed.
         if order.status in [ORDER_STATUS_FAILED, ORDER_STATUS_CANCELED, ORDER_STATUS_FILLED]:
             self._orders.pop(order_no)
+            self._order_sigs.pop(order_no, None)
 
     async def on_event_asset_update(self, asset: Asset):
         """ Asset update callback.
@@ -12,10 +12,10 @@ Email:  huangtao@ifclover.com
 import time
 import json
 import copy
-import hmac
 import zlib
-import base64
-from urllib.parse import urljoin
+import asyncio
+from types import MappingProxyType
+from urllib.parse import urljoin, urlencode
 
 from quant.error import Error
 from quant.utils import tools
@@ -25,7 +25,6 @@ from quant.order import Order
 from quant.tasks import SingleTask
 from quant.utils.websocket import Websocket
 from quant.asset import Asset, AssetSubscribe
-from quant.utils.decorator import async_method_locker
 from quant.utils.http_client import AsyncHttpRequests
 from quant.order import ORDER_ACTION_BUY, ORDER_ACTION_SELL
 from quant.order import ORDER_TYPE_LIMIT, ORDER_TYPE_MARKET
@@ -35,6 +34,39 @@ from quant.order import ORDER_STATUS_SUBMITTED, ORDER_STATUS_PARTIAL_FILLED, ORD
 
 __all__ = ("OKExRestAPI", "OKExTrade", )
 
+# Raw deflate payload of heartbeat response "pong".
+_compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+_PONG_COMPRESSED = _compressor.compress(b"pong") + _compressor.flush()
+del _compressor
+
+# Order state -> order status.
+_STATE_MAP = {
+    "-2": ORDER_STATUS_FAILED,
+    "-1": ORDER_STATUS_CANCELED,
+    "0": ORDER_STATUS_SUBMITTED,
+    "1": ORDER_STATUS_PARTIAL_FILLED,
+    "2": ORDER_STATUS_FILLED
+}
+
+# (action, order type) -> JSON body prefix of create order request, fields will be filled with
+# (symbol, price, quantity) for limit orders and (symbol, quantity) for market orders.
+_ORDER_BODY_TEMPLATES = {
+    (ORDER_ACTION_BUY, ORDER_TYPE_LIMIT):
+        '{"side":"buy","instrument_id":"%s","margin_trading":1,"type":"limit","price":"%s","size":"%s"',
+    (ORDER_ACTION_SELL, ORDER_TYPE_LIMIT):
+        '{"side":"sell","instrument_id":"%s","margin_trading":1,"type":"limit","price":"%s","size":"%s"',
+    (ORDER_ACTION_BUY, ORDER_TYPE_MARKET):
+        '{"side":"buy","instrument_id":"%s","margin_trading":1,"type":"market","notional":"%s"',
+    (ORDER_ACTION_SELL, ORDER_TYPE_MARKET):
+        '{"side":"sell","instrument_id":"%s","margin_trading":1,"type":"market","size":"%s"'
+}
+
+
+def _timestamp():
+    """ Get request timestamp, seconds with millisecond precision, e.g. `1548746434.123`.
+    """
+    return "%.3f" % time.time()
+
 
 class OKExRestAPI:
     """ OKEx REST API client.
@@ -52,6 +84,13 @@ class OKExRestAPI:
         self._access_key = access_key
         self._secret_key = secret_key
         self._passphrase = passphrase
+        self._hmac = tools.HmacSha256(secret_key)
+        # Static part of authenticated request headers.
+        self._auth_headers = {
+            "Content-Type": "application/json",
+            "OK-ACCESS-KEY": access_key,
+            "OK-ACCESS-PASSPHRASE": passphrase
+        }
 
     async def get_user_account(self):
         """ Get account asset information.
@@ -76,27 +115,20 @@ class OKExRestAPI:
             success: Success results, otherwise it's None.
             error: Error information, otherwise it's None.
         """
-        info = {
-            "side": "buy" if action == ORDER_ACTION_BUY else "sell",
-            "instrument_id": symbol,
-            "margin_trading": 1
-        }
-        if order_type == ORDER_TYPE_LIMIT:
-            info["type"] = "limit"
-            info["price"] = price
-            info["size"] = quantity
-        elif order_type == ORDER_TYPE_MARKET:
-            info["type"] = "market"
-            if action == ORDER_ACTION_BUY:
-                info["notional"] = quantity  # buy price.
-            else:
-                info["size"] = quantity  # sell quantity.
-        else:
+        side = ORDER_ACTION_BUY if action == ORDER_ACTION_BUY else ORDER_ACTION_SELL
+        template = _ORDER_BODY_TEMPLATES.get((side, order_type))
+        if template is None:
             logger.error("order_type error! order_type:", order_type, caller=self)
             return None
+        # Symbol, price and quantity are plain tokens, only client_oid is escaped by JSON encoder.
+        if order_type == ORDER_TYPE_LIMIT:
+            body = template % (symbol, price, quantity)
+        else:
+            body = template % (symbol, quantity)  # Notional for market buy, quantity for market sell.
         if client_oid:
-            info["client_oid"] = client_oid
-        result, error = await self.request("POST", "/api/spot/v3/orders", body=info, auth=True)
+            body += ',"client_oid":' + json.dumps(client_oid)
+        body += "}"
+        result, error = await self.request("POST", "/api/spot/v3/orders", body=body, auth=True)
         return result, error
 
     async def revoke_order(self, symbol, order_no):
@@ -112,7 +144,7 @@ class OKExRestAPI:
         body = {
             "instrument_id": symbol
         }
-        uri = "/api/spot/v3/cancel_orders/{order_no}".format(order_no=order_no)
+        uri = "/api/spot/v3/cancel_orders/" + str(order_no)
         result, error = await self.request("POST", uri, body=body, auth=True)
         if error:
             return order_no, error
@@ -175,7 +207,7 @@ class OKExRestAPI:
         params = {
             "instrument_id": symbol
         }
-        uri = "/api/spot/v3/orders/{order_no}".format(order_no=order_no)
+        uri = "/api/spot/v3/orders/" + str(order_no)
         result, error = await self.request("GET", uri, params=params, auth=True)
         return result, error
 
@@ -183,10 +215,10 @@ class OKExRestAPI:
         """ Do HTTP request.
 
         Args:
-            method: HTTP request method. GET, POST, DELETE, PUT.
+            method: HTTP request method, in upper case. GET, POST, DELETE, PUT.
             uri: HTTP request uri.
             params: HTTP query params.
-            body:   HTTP request body.
+            body:   HTTP request body. A string body is taken as serialized JSON and sent as is.
             headers: HTTP request headers.
             auth: If this request requires authentication.
 
@@ -195,29 +227,26 @@ class OKExRestAPI:
             error: Error information, otherwise it's None.
         """
         if params:
-            query = "&".join(["{}={}".format(k, params[k]) for k in sorted(params.keys())])
-            uri += "?" + query
+            uri += "?" + urlencode(sorted(params.items()))
         url = urljoin(self._host, uri)
 
         if auth:
-            timestamp = str(time.time()).split(".")[0] + "." + str(time.time()).split(".")[1][:3]
-            if body:
-                body = json.dumps(body)
+            timestamp = _timestamp()
+            if isinstance(body, str):
+                pass
+            elif body:
+                body = json.dumps(body, separators=(",", ":"))
             else:
                 body = ""
-            message = str(timestamp) + str.upper(method) + uri + str(body)
-            mac = hmac.new(bytes(self._secret_key, encoding="utf8"), bytes(message, encoding="utf-8"),
-                           digestmod="sha256")
-            d = mac.digest()
-            sign = base64.b64encode(d)
-
-            if not headers:
-                headers = {}
-            headers["Content-Type"] = "application/json"
-            headers["OK-ACCESS-KEY"] = self._access_key.encode().decode()
-            headers["OK-ACCESS-SIGN"] = sign.decode()
-            headers["OK-ACCESS-TIMESTAMP"] = str(timestamp)
-            headers["OK-ACCESS-PASSPHRASE"] = self._passphrase
+            message = timestamp + method + uri + body
+            sign = self._hmac.b64digest(message)
+
+            if headers:
+                headers = {**headers, **self._auth_headers}
+            else:
+                headers = self._auth_headers.copy()
+            headers["OK-ACCESS-SIGN"] = sign
+            headers["OK-ACCESS-TIMESTAMP"] = timestamp
         _, success, error = await AsyncHttpRequests.fetch(method, url, body=body, headers=headers, timeout=10)
         return success, error
 
@@ -279,12 +308,14 @@ class OKExTrade(Websocket):
         self._access_key = kwargs["access_key"]
         self._secret_key = kwargs["secret_key"]
         self._passphrase = kwargs["passphrase"]
+        self._hmac = tools.HmacSha256(self._secret_key)
         self._asset_update_callback = kwargs.get("asset_update_callback")
         self._order_update_callback = kwargs.get("order_update_callback")
         self._init_success_callback = kwargs.get("init_success_callback")
 
         self._raw_symbol = self._symbol.replace("/", "-")
-        self._order_channel = "spot/order:{symbol}".format(symbol=self._raw_symbol)
+        self._order_channel = "spot/order:" + self._raw_symbol
+        self._subscribe_msg = json.dumps({"op": "subscribe", "args": [self._order_channel]})
 
         url = self._wss + "/ws/v3"
         super(OKExTrade, self).__init__(url, send_hb_interval=5)
@@ -308,7 +339,8 @@ class OKExTrade(Websocket):
 
     @property
     def orders(self):
-        return copy.copy(self._orders)
+        """Read-only view of current orders, it's updated in place, so DO NOT modify it."""
+        return MappingProxyType(self._orders)
 
     @property
     def rest_api(self):
@@ -316,18 +348,15 @@ class OKExTrade(Websocket):
 
     async def connected_callback(self):
         """After websocket connection created successfully, we will send a message to server for authentication."""
-        timestamp = str(time.time()).split(".")[0] + "." + str(time.time()).split(".")[1][:3]
-        message = str(timestamp) + "GET" + "/users/self/verify"
-        mac = hmac.new(bytes(self._secret_key, encoding="utf8"), bytes(message, encoding="utf8"), digestmod="sha256")
-        d = mac.digest()
-        signature = base64.b64encode(d).decode()
+        timestamp = _timestamp()
+        message = timestamp + "GET/users/self/verify"
+        signature = self._hmac.b64digest(message)
         data = {
             "op": "login",
             "args": [self._access_key, self._passphrase, timestamp, signature]
         }
         await self.ws.send_json(data)
 
-    @async_method_locker("OKExTrade.process_binary.locker")
     async def process_binary(self, raw):
         """ Process binary message that received from websocket.
 
@@ -337,15 +366,24 @@ class OKExTrade(Websocket):
         Returns:
             None.
         """
-        decompress = zlib.decompressobj(-zlib.MAX_WBITS)
-        msg = decompress.decompress(raw)
-        msg += decompress.flush()
-        msg = msg.decode()
-        if msg == "pong":
+        if raw == _PONG_COMPRESSED:
             return
+        msg = zlib.decompress(raw, -zlib.MAX_WBITS)
+        if msg == b"pong":
+            return
+        msg = msg.decode()
         logger.debug("msg:", msg, caller=self)
-        msg = json.loads(msg)
+        await self._process_message(json.loads(msg))
 
+    async def _process_message(self, msg):
+        """ Process message that decoded from websocket binary frame.
+
+        Args:
+            msg: Message decoded from websocket binary frame, dict format.
+
+        Returns:
+            None.
+        """
         # Authorization message received.
         if msg.get("event") == "login":
             if not msg.get("success"):
@@ -364,17 +402,12 @@ class OKExTrade(Websocket):
 
             if len(order_infos) > 100:
                 logger.warn("order length too long! (more than 100)", caller=self)
+            update = self._update_order
             for order_info in order_infos:
-                order_info["ctime"] = order_info["created_at"]
-                order_info["utime"] = order_info["timestamp"]
-                self._update_order(order_info)
+                update(order_info, order_info["created_at"], order_info["timestamp"])
 
             # Subscribe order channel.
-            data = {
-                "op": "subscribe",
-                "args": [self._order_channel]
-            }
-            await self.ws.send_json(data)
+            await self.ws.send_str(self._subscribe_msg)
             return
 
         # Subscribe response message received.
@@ -388,10 +421,9 @@ class OKExTrade(Websocket):
 
         # Order update message received.
         if msg.get("table") == "spot/order":
+            update = self._update_order
             for data in msg["data"]:
-                data["ctime"] = data["timestamp"]
-                data["utime"] = data["last_fill_time"]
-                self._update_order(data)
+                update(data, data["timestamp"], data["last_fill_time"])
 
     async def create_order(self, action, price, quantity, order_type=ORDER_TYPE_LIMIT, *args, **kwargs):
         """ Create an order.
@@ -429,7 +461,7 @@ class OKExTrade(Websocket):
             Success or error, see bellow.
 
         NOTEs:
-            DO NOT INPUT MORE THAT 10 ORDER NOs, you can invoke many times.
+            Multiple orders are revoked by batch cancel API, 10 orders per request.
         """
         # If len(order_nos) == 0, you will cancel all orders for this symbol(initialized in Trade object).
         if len(order_nos) == 0:
@@ -438,11 +470,9 @@ class OKExTrade(Websocket):
                 return False, error
             if len(order_infos) > 100:
                 logger.warn("order length too long! (more than 100)", caller=self)
-            for order_info in order_infos:
-                order_no = order_info["order_id"]
-                _, error = await self._rest_api.revoke_order(self._raw_symbol, order_no)
-                if error:
-                    return False, error
+            _, errors = await self._revoke_orders([order_info["order_id"] for order_info in order_infos])
+            if errors:
+                return False, errors[0][1]
             return True, None
 
         # If len(order_nos) == 1, you will cancel an order.
@@ -455,15 +485,41 @@ class OKExTrade(Websocket):
 
         # If len(order_nos) > 1, you will cancel multiple orders.
         if len(order_nos) > 1:
-            success, error = [], []
-            for order_no in order_nos:
-                _, e = await self._rest_api.revoke_order(self._raw_symbol, order_no)
-                if e:
-                    error.append((order_no, e))
-                else:
-                    success.append(order_no)
+            success, error = await self._revoke_orders(list(order_nos))
             return success, error
 
+    async def _revoke_orders(self, order_nos):
+        """ Revoke orders with batch cancel API, 10 orders per request, and all requests are sent concurrently.
+
+        Args:
+            order_nos: Order id list.
+
+        Returns:
+            success: Order id list of revoked orders.
+            error: List of (order_no, error) for orders failed to revoke.
+        """
+        chunks = [order_nos[i:i + 10] for i in range(0, len(order_nos), 10)]
+        results = await asyncio.gather(*[self._rest_api.revoke_orders(self._raw_symbol, chunk) for chunk in chunks])
+        success, error = [], []
+        for chunk, (result, e) in zip(chunks, results):
+            if e:
+                error.extend((order_no, e) for order_no in chunk)
+                continue
+            # e.g. {"btc-usdt": [{"order_id": "2510832677225473", "result": true, ...}, ...]}
+            infos = {}
+            items = result.get(self._raw_symbol.lower()) if isinstance(result, dict) else None
+            if isinstance(items, list):
+                for item in items:
+                    if isinstance(item, dict) and item.get("order_id") is not None:
+                        infos[str(item["order_id"])] = item
+            for order_no in chunk:
+                info = infos.get(str(order_no))
+                if info and info.get("result"):
+                    success.append(order_no)
+                else:
+                    error.append((order_no, info or result))
+        return success, error
+
     async def get_open_order_nos(self):
         """ Get open order id list.
 
@@ -485,34 +541,30 @@ class OKExTrade(Websocket):
                 order_nos.append(order_info["order_id"])
             return order_nos, None
 
-    def _update_order(self, order_info):
+    def _update_order(self, order_info, ctime, utime):
         """ Order update.
 
         Args:
             order_info: Order information.
+            ctime: Order create time, UTC time string.
+            utime: Order update time, UTC time string.
 
         Returns:
             None.
         """
-        order_no = str(order_info["order_id"])
-        state = order_info["state"]
-        remain = float(order_info["size"]) - float(order_info["filled_size"])
-        ctime = tools.utctime_str_to_mts(order_info["ctime"])
-        utime = tools.utctime_str_to_mts(order_info["utime"])
-
-        if state == "-2":
-            status = ORDER_STATUS_FAILED
-        elif state == "-1":
-            status = ORDER_STATUS_CANCELED
-        elif state == "0":
-            status = ORDER_STATUS_SUBMITTED
-        elif state == "1":
-            status = ORDER_STATUS_PARTIAL_FILLED
-        elif state == "2":
-            status = ORDER_STATUS_FILLED
-        else:
+        status = _STATE_MAP.get(order_info["state"])
+        if status is None:
             logger.error("status error! order_info:", order_info, caller=self)
             return None
+        order_no = str(order_info["order_id"])
+        if status == ORDER_STATUS_FILLED:
+            remain = 0.0
+        elif status == ORDER_STATUS_SUBMITTED:
+            remain = float(order_info["size"])  # Nothing filled yet.
+        else:
+            remain = float(order_info["size"]) - float(order_info["filled_size"])
+        ctime = tools.utctime_str_to_mts(ctime)
+        utime = tools.utctime_str_to_mts(utime)
 
         order = self._orders.get(order_no)
         if order:
@@ -520,26 +572,17 @@ class OKExTrade(Websocket):
             order.status = status
             order.price = order_info["price"]
         else:
-            info = {
-                "platform": self._platform,
-                "account": self._account,
-                "strategy": self._strategy,
-                "order_no": order_no,
-                "client_order_id": order_info["client_oid"],
-                "action": ORDER_ACTION_BUY if order_info["side"] == "buy" else ORDER_ACTION_SELL,
-                "symbol": self._symbol,
-                "price": order_info["price"],
-                "quantity": order_info["size"],
-                "remain": remain,
-                "status": status,
-                "avg_price": order_info["price"]
-            }
-            order = Order(**info)
+            order = Order(platform=self._platform, account=self._account, strategy=self._strategy,
+                          order_no=order_no, client_order_id=order_info["client_oid"],
+                          action=ORDER_ACTION_BUY if order_info["side"] == "buy" else ORDER_ACTION_SELL,
+                          symbol=self._symbol, price=order_info["price"], quantity=order_info["size"],
+                          remain=remain, status=status, avg_price=order_info["price"])
             self._orders[order_no] = order
         order.ctime = ctime
         order.utime = utime
 
-        SingleTask.run(self._order_update_callback, copy.copy(order))
+        if self._order_update_callback:
+            SingleTask.run(self._order_update_callback, order.snapshot())
 
         if status in [ORDER_STATUS_FAILED, ORDER_STATUS_CANCELED, ORDER_STATUS_FILLED]:
             self._orders.pop(order_no)
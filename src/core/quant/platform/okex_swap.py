@@ -14,10 +14,10 @@ Email:  huangtao@ifclover.com
 import time
 import zlib
 import json
+import asyncio
 import copy
-import hmac
-import base64
-from urllib.parse import urljoin
+from types import MappingProxyType
+from urllib.parse import urlencode
 
 from quant.error import Error
 from quant.order import Order
@@ -29,7 +29,6 @@ from quant.const import OKEX_SWAP
 from quant.utils.websocket import Websocket
 from quant.asset import Asset, AssetSubscribe
 from quant.utils.http_client import AsyncHttpRequests
-from quant.utils.decorator import async_method_locker
 from quant.order import ORDER_ACTION_BUY, ORDER_ACTION_SELL, ORDER_TYPE_LIMIT, ORDER_TYPE_MARKET
 from quant.order import ORDER_STATUS_SUBMITTED, ORDER_STATUS_PARTIAL_FILLED, ORDER_STATUS_FILLED, \
     ORDER_STATUS_CANCELED, ORDER_STATUS_FAILED
@@ -37,6 +36,41 @@ from quant.order import ORDER_STATUS_SUBMITTED, ORDER_STATUS_PARTIAL_FILLED, ORD
 
 __all__ = ("OKExSwapRestAPI", "OKExSwapTrade", )
 
+# Order statuses that an order will not be updated any more.
+_FINAL_STATUSES = frozenset((ORDER_STATUS_FAILED, ORDER_STATUS_CANCELED, ORDER_STATUS_FILLED))
+
+# Trade types of buy orders, 1: open long, 4: close short.
+_BUY_TYPES = frozenset(("1", "4"))
+
+# (quantity > 0, action is buy) -> trade type, 1: open long, 2: open short, 3: close long, 4: close short.
+_TRADE_TYPE_MAP = {
+    (True, True): "1",
+    (True, False): "3",
+    (False, True): "4",
+    (False, False): "2"
+}
+
+# Order type -> OKEx swap order type, 0: normal limit order, 2: fill or kill.
+_ORDER_TYPE_MAP = {
+    ORDER_TYPE_LIMIT: 0,
+    ORDER_TYPE_MARKET: 2
+}
+
+# Order state -> order status.
+_STATE_MAP = {
+    "-2": ORDER_STATUS_FAILED,
+    "-1": ORDER_STATUS_CANCELED,
+    "0": ORDER_STATUS_SUBMITTED,
+    "1": ORDER_STATUS_PARTIAL_FILLED,
+    "2": ORDER_STATUS_FILLED
+}
+
+
+def _timestamp():
+    """ Get request timestamp, seconds with millisecond precision, e.g. `1548746434.123`.
+    """
+    return "%.3f" % time.time()
+
 
 class OKExSwapRestAPI:
     """ OKEx Swap REST API client.
@@ -50,10 +84,18 @@ class OKExSwapRestAPI:
 
     def __init__(self, host, access_key, secret_key, passphrase):
         """initialize REST API client."""
-        self._host = host
+        self._host = host.rstrip("/")
         self._access_key = access_key
         self._secret_key = secret_key
         self._passphrase = passphrase
+        self._hmac = tools.HmacSha256(secret_key)
+
+        # Static part of authenticated request headers.
+        self._auth_headers = {
+            "Content-Type": "application/json",
+            "OK-ACCESS-KEY": access_key,
+            "OK-ACCESS-PASSPHRASE": passphrase
+        }
 
     async def get_user_account(self):
         """ Get the perpetual swap account info of all tokens. Margin ratio set as 10,000 when users have no open
@@ -75,7 +117,7 @@ class OKExSwapRestAPI:
             success: Success results, otherwise it's None.
             error: Error information, otherwise it's None.
         """
-        uri = "/api/swap/v3/{instrument_id}/position".format(instrument_id=instrument_id)
+        uri = "/api/swap/v3/" + instrument_id + "/position"
         success, error = await self.request("GET", uri, auth=True)
         return success, error
 
@@ -120,8 +162,7 @@ class OKExSwapRestAPI:
             success: Success results, otherwise it's None.
             error: Error information, otherwise it's None.
         """
-        uri = "/api/swap/v3/cancel_order/{instrument_id}/{order_id}".format(instrument_id=instrument_id,
-                                                                            order_id=order_id)
+        uri = "/api/swap/v3/cancel_order/" + instrument_id + "/" + str(order_id)
         success, error = await self.request("POST", uri, auth=True)
         if error:
             return None, error
@@ -144,14 +185,14 @@ class OKExSwapRestAPI:
         assert isinstance(order_ids, list)
         if len(order_ids) > 10:
             logger.warn("order id list too long! no more than 10!", caller=self)
-        uri = "/api/swap/v3/cancel_batch_orders/{instrument_id}".format(instrument_id=instrument_id)
+        uri = "/api/swap/v3/cancel_batch_orders/" + instrument_id
         body = {
             "ids": order_ids
         }
         success, error = await self.request("POST", uri, body=body, auth=True)
         if error:
             return None, error
-        if not success["result"]:
+        if str(success.get("result")).lower() != "true":  # `result` is string "true" or "false".
             return None, success
         return success, None
 
@@ -166,7 +207,7 @@ class OKExSwapRestAPI:
             success: Success results, otherwise it's None.
             error: Error information, otherwise it's None.
         """
-        uri = "/api/swap/v3/orders/{instrument_id}/{order_id}".format(instrument_id=instrument_id, order_id=order_id)
+        uri = "/api/swap/v3/orders/" + instrument_id + "/" + str(order_id)
         success, error = await self.request("GET", uri, auth=True)
         return success, error
 
@@ -186,7 +227,7 @@ class OKExSwapRestAPI:
 
         TODO: Add args `from` & `to`.
         """
-        uri = "/api/swap/v3/orders/{instrument_id}".format(instrument_id=instrument_id)
+        uri = "/api/swap/v3/orders/" + instrument_id
         params = {
             "state": state,
             "limit": limit
@@ -198,7 +239,7 @@ class OKExSwapRestAPI:
         """ Do HTTP request.
 
         Args:
-            method: HTTP request method. GET, POST, DELETE, PUT.
+            method: HTTP request method, in upper case. GET, POST, DELETE, PUT.
             uri: HTTP request uri.
             params: HTTP query params.
             body:   HTTP request body.
@@ -210,35 +251,29 @@ class OKExSwapRestAPI:
             error: Error information, otherwise it's None.
         """
         if params:
-            query = "&".join(["{}={}".format(k, params[k]) for k in sorted(params.keys())])
-            uri += "?" + query
-        url = urljoin(self._host, uri)
+            uri += "?" + urlencode(sorted(params.items()))
+        url = self._host + uri  # All request uris are absolute paths.
 
         # Add signature for authentication.
         if auth:
-            timestamp = str(time.time()).split(".")[0] + "." + str(time.time()).split(".")[1][:3]
+            timestamp = _timestamp()
             if body:
-                body = json.dumps(body)
+                body = json.dumps(body, separators=(",", ":")).encode("utf-8")
+            else:
+                body = b""
+            sign = self._hmac.b64digest((timestamp + method + uri).encode("utf-8") + body)
+
+            if headers:
+                headers = {**headers, **self._auth_headers}
             else:
-                body = ""
-            message = str(timestamp) + str.upper(method) + uri + str(body)
-            mac = hmac.new(bytes(self._secret_key, encoding="utf8"), bytes(message, encoding="utf-8"),
-                           digestmod="sha256")
-            d = mac.digest()
-            sign = base64.b64encode(d)
-
-            if not headers:
-                headers = {}
-            headers["Content-Type"] = "application/json"
-            headers["OK-ACCESS-KEY"] = self._access_key.encode().decode()
-            headers["OK-ACCESS-SIGN"] = sign.decode()
-            headers["OK-ACCESS-TIMESTAMP"] = str(timestamp)
-            headers["OK-ACCESS-PASSPHRASE"] = self._passphrase
+                headers = self._auth_headers.copy()
+            headers["OK-ACCESS-SIGN"] = sign
+            headers["OK-ACCESS-TIMESTAMP"] = timestamp
 
         _, success, error = await AsyncHttpRequests.fetch(method, url, body=body, headers=headers, timeout=10)
         if error:
             return None, error
-        if not isinstance(success, dict):  # If response data is not dict format, convert it to json format.
+        if isinstance(success, str):  # Response data was not decoded as JSON by HTTP client, decode it here.
             success = json.loads(success)
         return success, None
 
@@ -303,6 +338,7 @@ class OKExSwapTrade(Websocket):
         self._access_key = kwargs["access_key"]
         self._secret_key = kwargs["secret_key"]
         self._passphrase = kwargs["passphrase"]
+        self._hmac = tools.HmacSha256(self._secret_key)
         self._asset_update_callback = kwargs.get("asset_update_callback")
         self._order_update_callback = kwargs.get("order_update_callback")
         self._position_update_callback = kwargs.get("position_update_callback")
@@ -317,8 +353,18 @@ class OKExSwapTrade(Websocket):
         self._position = Position(self._platform, self._account, self._strategy, self._symbol)
 
         # Subscribing our channels.
-        self._order_channel = "swap/order:{symbol}".format(symbol=self._symbol)
-        self._position_channel = "swap/position:{symbol}".format(symbol=self._symbol)
+        self._order_channel = "swap/order:" + self._symbol
+        self._position_channel = "swap/position:" + self._symbol
+
+        # Websocket message handlers, dispatched by `table` for pushed data and by `event` for responses.
+        self._table_handlers = {
+            "swap/order": self._on_order_table,
+            "swap/position": self._on_position_table
+        }
+        self._event_handlers = {
+            "login": self._on_login,
+            "subscribe": self._on_subscribe
+        }
 
         # If our channels that subscribed successfully.
         self._subscribe_order_ok = False
@@ -327,6 +373,9 @@ class OKExSwapTrade(Websocket):
         # Initializing our REST API client.
         self._rest_api = OKExSwapRestAPI(self._host, self._access_key, self._secret_key, self._passphrase)
 
+        # At most 10 batch cancel requests in flight, shared by all revoke calls, to keep under rate limit.
+        self._revoke_semaphore = asyncio.Semaphore(10)
+
         # Subscribing our asset event.
         if self._asset_update_callback:
             AssetSubscribe(self._platform, self._account, self.on_event_asset_update)
@@ -339,7 +388,8 @@ class OKExSwapTrade(Websocket):
 
     @property
     def orders(self):
-        return copy.copy(self._orders)
+        """Read-only view of current orders, it's updated in place, so DO NOT modify it."""
+        return MappingProxyType(self._orders)
 
     @property
     def position(self):
@@ -351,18 +401,15 @@ class OKExSwapTrade(Websocket):
 
     async def connected_callback(self):
         """After websocket connection created successfully, we will send a message to server for authentication."""
-        timestamp = str(time.time()).split(".")[0] + "." + str(time.time()).split(".")[1][:3]
+        timestamp = _timestamp()
         message = str(timestamp) + "GET" + "/users/self/verify"
-        mac = hmac.new(bytes(self._secret_key, encoding="utf8"), bytes(message, encoding="utf8"), digestmod="sha256")
-        d = mac.digest()
-        signature = base64.b64encode(d).decode()
+        signature = self._hmac.b64digest(message)
         data = {
             "op": "login",
             "args": [self._access_key, self._passphrase, timestamp, signature]
         }
         await self.ws.send_json(data)
 
-    @async_method_locker("OKExSwapTrade.process_binary.locker")
     async def process_binary(self, raw):
         """ Process binary message that received from websocket.
 
@@ -372,74 +419,79 @@ class OKExSwapTrade(Websocket):
         Returns:
             None.
         """
-        decompress = zlib.decompressobj(-zlib.MAX_WBITS)
-        msg = decompress.decompress(raw)
-        msg += decompress.flush()
-        msg = msg.decode()
+        msg = zlib.decompress(raw, -zlib.MAX_WBITS)
 
         # Heartbeat message received.
-        if msg == "pong":
+        if msg == b"pong":
             return
 
+        msg = msg.decode()
         logger.debug("msg:", msg, caller=self)
         msg = json.loads(msg)
 
-        # Authorization message received.
-        if msg.get("event") == "login":
-            if not msg.get("success"):
-                e = Error("Websocket connection authorized failed: {}".format(msg))
-                logger.error(e, caller=self)
-                SingleTask.run(self._init_success_callback, False, e)
-                return
-            logger.info("Websocket connection authorized successfully.", caller=self)
+        # Order or position update message received.
+        handler = self._table_handlers.get(msg.get("table"))
+        if handler:
+            handler(msg)
+            return
 
-            # Fetch orders from server. (open + partially filled)
-            result, error = await self._rest_api.get_order_list(self._symbol, 6)
-            if error:
-                e = Error("get open orders error: {}".format(error))
-                SingleTask.run(self._init_success_callback, False, e)
-                return
-            if len(result) > 100:
-                logger.warn("order length too long! (more than 100)", caller=self)
-            for order_info in result["order_info"]:
-                self._update_order(order_info)
+        # Authorization or subscribe response message received.
+        handler = self._event_handlers.get(msg.get("event"))
+        if handler:
+            await handler(msg)
 
-            # Fetch positions from server.
-            position, error = await self._rest_api.get_position(self._symbol)
-            if error:
-                e = Error("get position error: {}".format(error))
-                SingleTask.run(self._init_success_callback, False, e)
-                return
-            self._update_position(position)
-
-            # Subscribe order channel and position channel.
-            data = {
-                "op": "subscribe",
-                "args": [self._order_channel, self._position_channel]
-            }
-            await self.ws.send_json(data)
+    async def _on_login(self, msg):
+        """Fetch orders and position, then subscribe our channels after authorized successfully."""
+        if not msg.get("success"):
+            e = Error("Websocket connection authorized failed: {}".format(msg))
+            logger.error(e, caller=self)
+            SingleTask.run(self._init_success_callback, False, e)
             return
+        logger.info("Websocket connection authorized successfully.", caller=self)
 
-        # Subscribe response message received.
-        if msg.get("event") == "subscribe":
-            if msg.get("channel") == self._order_channel:
-                self._subscribe_order_ok = True
-            if msg.get("channel") == self._position_channel:
-                self._subscribe_position_ok = True
-            if self._subscribe_order_ok and self._subscribe_position_ok:
-                SingleTask.run(self._init_success_callback, True, None)
+        # Fetch orders (open + partially filled) and positions from server concurrently.
+        (result, error), (position, position_error) = await asyncio.gather(
+            self._rest_api.get_order_list(self._symbol, 6), self._rest_api.get_position(self._symbol))
+        if error:
+            e = Error("get open orders error: {}".format(error))
+            SingleTask.run(self._init_success_callback, False, e)
             return
-
-        # Order update message received.
-        if msg.get("table") == "swap/order":
-            for data in msg["data"]:
-                self._update_order(data)
+        if len(result) > 100:
+            logger.warn("order length too long! (more than 100)", caller=self)
+        for order_info in result["order_info"]:
+            self._update_order(order_info)
+
+        if position_error:
+            e = Error("get position error: {}".format(position_error))
+            SingleTask.run(self._init_success_callback, False, e)
             return
+        self._update_position(position)
+
+        # Subscribe order channel and position channel.
+        data = {
+            "op": "subscribe",
+            "args": [self._order_channel, self._position_channel]
+        }
+        await self.ws.send_json(data)
 
-        # Position update message receive.
-        if msg.get("table") == "swap/position":
-            for data in msg["data"]:
-                self._update_position(data)
+    async def _on_subscribe(self, msg):
+        """Initialize successfully after both order channel and position channel subscribed."""
+        if msg.get("channel") == self._order_channel:
+            self._subscribe_order_ok = True
+        if msg.get("channel") == self._position_channel:
+            self._subscribe_position_ok = True
+        if self._subscribe_order_ok and self._subscribe_position_ok:
+            SingleTask.run(self._init_success_callback, True, None)
+
+    def _on_order_table(self, msg):
+        """Order update message."""
+        for data in msg["data"]:
+            self._update_order(data)
+
+    def _on_position_table(self, msg):
+        """Position update message."""
+        for data in msg["data"]:
+            self._update_position(data)
 
     async def create_order(self, action, price, quantity, order_type=ORDER_TYPE_LIMIT, match_price=0, *args, **kwargs):
         """ Create an order.
@@ -458,22 +510,11 @@ class OKExSwapTrade(Websocket):
             order_no: Order ID if created successfully, otherwise it's None.
             error: Error information, otherwise it's None.
         """
-        if int(quantity) > 0:
-            if action == ORDER_ACTION_BUY:
-                trade_type = "1"
-            else:
-                trade_type = "3"
-        else:
-            if action == ORDER_ACTION_BUY:
-                trade_type = "4"
-            else:
-                trade_type = "2"
-        quantity = abs(int(quantity))
-        if order_type == ORDER_TYPE_LIMIT:
-            order_type_2 = 0
-        elif order_type == ORDER_TYPE_MARKET:
-            order_type_2 = 2
-        else:
+        quantity = int(quantity)
+        trade_type = _TRADE_TYPE_MAP[(quantity > 0, action == ORDER_ACTION_BUY)]
+        quantity = abs(quantity)
+        order_type_2 = _ORDER_TYPE_MAP.get(order_type)
+        if order_type_2 is None:
             return None, "order type error"
         client_order_id = kwargs.get("client_order_id")
         result, error = await self._rest_api.create_order(self._symbol, trade_type, price, quantity, match_price,
@@ -501,11 +542,9 @@ class OKExSwapTrade(Websocket):
                 return False, error
             if len(result) > 100:
                 logger.warn("order length too long! (more than 100)", caller=self)
-            for order_info in result["order_info"]:
-                order_no = order_info["order_id"]
-                _, error = await self._rest_api.revoke_order(self._symbol, order_no)
-                if error:
-                    return False, error
+            _, errors = await self._revoke_orders([order_info["order_id"] for order_info in result["order_info"]])
+            if errors:
+                return False, errors[0][1]
             return True, None
 
         # If len(order_nos) == 1, you will cancel an order.
@@ -518,15 +557,41 @@ class OKExSwapTrade(Websocket):
 
         # If len(order_nos) > 1, you will cancel multiple orders.
         if len(order_nos) > 1:
-            success, error = [], []
-            for order_no in order_nos:
-                _, e = await self._rest_api.revoke_order(self._symbol, order_no)
-                if e:
-                    error.append((order_no, e))
-                else:
-                    success.append(order_no)
+            success, error = await self._revoke_orders(list(order_nos))
             return success, error
 
+    async def _revoke_orders(self, order_nos):
+        """ Revoke orders with batch cancel API, 10 orders per request, and requests are sent concurrently.
+
+        Args:
+            order_nos: Order id list.
+
+        Returns:
+            success: Order id list of revoked orders.
+            error: List of (order_no, error) for orders failed to revoke.
+        """
+        chunks = [order_nos[i:i + 10] for i in range(0, len(order_nos), 10)]
+        results = await asyncio.gather(*[self._revoke_chunk(chunk) for chunk in chunks])
+        success, error = [], []
+        for chunk, (result, e) in zip(chunks, results):
+            if e:
+                error.extend((order_no, e) for order_no in chunk)
+                continue
+            # e.g. {"result": "true", "ids": ["64-2a-26132f931-3"], "instrument_id": "BTC-USD-SWAP", ...}
+            ids = result.get("ids")
+            revoked = {str(order_id) for order_id in ids} if isinstance(ids, list) else set()
+            for order_no in chunk:
+                if str(order_no) in revoked:
+                    success.append(order_no)
+                else:
+                    error.append((order_no, result))
+        return success, error
+
+    async def _revoke_chunk(self, order_nos):
+        """Revoke no more than 10 orders with one batch cancel request, bounded by revoke semaphore."""
+        async with self._revoke_semaphore:
+            return await self._rest_api.revoke_orders(self._symbol, order_nos)
+
     async def get_open_order_nos(self):
         """ Get open order id list.
 
@@ -557,49 +622,33 @@ class OKExSwapTrade(Websocket):
         Returns:
             None.
         """
+        status = _STATE_MAP.get(order_info["state"])
+        if status is None:
+            return None
         order_no = str(order_info["order_id"])
-        state = order_info["state"]
-        remain = int(order_info["size"]) - int(order_info["filled_qty"])
+        size = order_info["size"]
+        remain = int(size) - int(order_info["filled_qty"])
         ctime = tools.utctime_str_to_mts(order_info["timestamp"])
-        if state == "-2":
-            status = ORDER_STATUS_FAILED
-        elif state == "-1":
-            status = ORDER_STATUS_CANCELED
-        elif state == "0":
-            status = ORDER_STATUS_SUBMITTED
-        elif state == "1":
-            status = ORDER_STATUS_PARTIAL_FILLED
-        elif state == "2":
-            status = ORDER_STATUS_FILLED
-        else:
-            return None
 
         order = self._orders.get(order_no)
         if not order:
-            info = {
-                "platform": self._platform,
-                "account": self._account,
-                "strategy": self._strategy,
-                "order_no": order_no,
-                "client_order_id": order_info["client_oid"],
-                "action": ORDER_ACTION_BUY if order_info["type"] in ["1", "4"] else ORDER_ACTION_SELL,
-                "symbol": self._symbol,
-                "price": order_info["price"],
-                "quantity": order_info["size"],
-                "trade_type": int(order_info["type"])
-            }
-            order = Order(**info)
+            trade_type = order_info["type"]
+            order = Order(platform=self._platform, account=self._account, strategy=self._strategy,
+                          order_no=order_no, client_order_id=order_info["client_oid"],
+                          action=ORDER_ACTION_BUY if trade_type in _BUY_TYPES else ORDER_ACTION_SELL,
+                          symbol=self._symbol, price=order_info["price"], quantity=size,
+                          trade_type=int(trade_type))
+            self._orders[order_no] = order
         order.remain = remain
         order.status = status
         order.avg_price = order_info["price_avg"]
         order.ctime = ctime
         order.utime = ctime
-        self._orders[order_no] = order
 
         SingleTask.run(self._order_update_callback, copy.copy(order))
 
-        if status in [ORDER_STATUS_FAILED, ORDER_STATUS_CANCELED, ORDER_STATUS_FILLED]:
-            self._orders.pop(order_no)
+        if status in _FINAL_STATUSES:
+            self._orders.pop(order_no, None)
 
     def _update_position(self, position_info):
         """ Position update.
@@ -624,7 +673,7 @@ class OKExSwapTrade(Websocket):
             else:
                 continue
             self._position.utime = tools.utctime_str_to_mts(item["timestamp"])
-        SingleTask.run(self._position_update_callback, copy.copy(self.position))
+        SingleTask.run(self._position_update_callback, copy.copy(self._position))
 
     async def on_event_asset_update(self, asset: Asset):
         """ Asset event data callback.
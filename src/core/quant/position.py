@@ -41,6 +41,13 @@ class Position:
         self.liquid_price = liquid_price
         self.utime = utime if utime else tools.get_cur_timestamp_ms()
 
+    def __copy__(self):
+        """ 浅拷贝持仓对象，避免 copy.copy 走通用的 __reduce_ex__ 流程
+        """
+        position = Position.__new__(Position)
+        position.__dict__.update(self.__dict__)
+        return position
+
     def __str__(self):
         info = "[platform: {platform}, account: {account}, strategy: {strategy}, symbol: {symbol}, " \
                "short_quantity: {short_quantity}, short_avg_price: {short_avg_price}, " \
@@ -127,6 +127,11 @@ class AsyncHttpRequests(object):
         parsed_url = urlparse(url)
         key = parsed_url.netloc or parsed_url.hostname
         if key not in cls._SESSIONS:
-            session = aiohttp.ClientSession()
+            # Keep idle connections alive between polling requests, and clean up SSL transports that were not closed
+            # properly by server, otherwise these dead connections will remain in the keep-alive pool. Resolved DNS
+            # results are cached for 5 minutes, since every session serves one domain only.
+            connector = aiohttp.TCPConnector(limit=100, keepalive_timeout=75, enable_cleanup_closed=True,
+                                             ttl_dns_cache=300)
+            session = aiohttp.ClientSession(connector=connector)
             cls._SESSIONS[key] = session
         return cls._SESSIONS[key]
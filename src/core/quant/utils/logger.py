@@ -51,6 +51,8 @@ def initLogger(log_level="DEBUG", log_path=None, logfile_name=None, clear=False,
 
 
 def info(*args, **kwargs):
+    if not logging.root.isEnabledFor(logging.INFO):  # Skip building the message if it would be dropped.
+        return
     func_name, kwargs = _log_msg_header(*args, **kwargs)
     logging.info(_log(func_name, *args, **kwargs))
 
@@ -61,6 +63,8 @@ def warn(*args, **kwargs):
 
 
 def debug(*args, **kwargs):
+    if not logging.root.isEnabledFor(logging.DEBUG):  # Skip building the message if it would be dropped.
+        return
     msg_header, kwargs = _log_msg_header(*args, **kwargs)
     logging.debug(_log(msg_header, *args, **kwargs))
 
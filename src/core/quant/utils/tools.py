@@ -10,9 +10,15 @@ Update: 2018/09/07 1. 增加函数datetime_to_timestamp;
 
 import uuid
 import time
+import base64
 import decimal
+import hashlib
 import datetime
 
+# 将 HMAC 密钥的每个字节与 ipad(0x36) 和 opad(0x5C) 异或的转换表
+_TRANS_36 = bytes(x ^ 0x36 for x in range(256))
+_TRANS_5C = bytes(x ^ 0x5C for x in range(256))
+
 
 def get_cur_timestamp():
     """ 获取当前时间戳
@@ -187,3 +193,41 @@ def float_to_str(f, p=20):
     ctx = decimal.Context(p)
     d1 = ctx.create_decimal(repr(f))
     return format(d1, 'f')
+
+
+class HmacSha256:
+    """ HMAC-SHA256 签名
+    初始化时用密钥预先计算好内外两层哈希状态，每次签名只需复制状态，不用重新计算密钥填充
+    """
+
+    def __init__(self, secret_key):
+        """ 初始化
+        @param secret_key 密钥，str 或 bytes
+        """
+        if isinstance(secret_key, str):
+            secret_key = secret_key.encode("utf-8")
+        if len(secret_key) > 64:
+            secret_key = hashlib.sha256(secret_key).digest()
+        secret_key = secret_key.ljust(64, b"\0")
+        self._inner = hashlib.sha256(secret_key.translate(_TRANS_36))
+        self._outer = hashlib.sha256(secret_key.translate(_TRANS_5C))
+
+    def digest(self, message):
+        """ 签名
+        @param message 待签名消息，str 或 bytes
+        @return 签名结果 bytes
+        """
+        if isinstance(message, str):
+            message = message.encode("utf-8")
+        inner = self._inner.copy()
+        inner.update(message)
+        outer = self._outer.copy()
+        outer.update(inner.digest())
+        return outer.digest()
+
+    def b64digest(self, message):
+        """ 签名，并 base64 编码
+        @param message 待签名消息，str 或 bytes
+        @return 签名结果 str
+        """
+        return base64.b64encode(self.digest(message)).decode("ascii")
@@ -12,17 +12,20 @@ import json
 
 from quant.utils import exceptions
 
+# Common spellings of bool strings, checked before falling back to case-insensitive comparison.
+_TRUE_STRINGS = frozenset(("true", "True", "TRUE"))
+_FALSE_STRINGS = frozenset(("false", "False", "FALSE"))
+
 
 def _field(data, field, required):
-    if field:
-        data = data or {}
-        if not isinstance(data, dict):
-            raise exceptions.ValidationError("field `{field}` lost".format(field=field))
-        if required and field not in data:
-            raise exceptions.ValidationError("field `{field}` lost".format(field=field))
-        return data.get(field)
-    else:
-        return data
+    """ Get `field` from `data`, validators only call it when `field` is given, otherwise `data` is `field`.
+    """
+    data = data or {}
+    if not isinstance(data, dict):
+        raise exceptions.ValidationError("field `{field}` lost".format(field=field))
+    if required and field not in data:
+        raise exceptions.ValidationError("field `{field}` lost".format(field=field))
+    return data.get(field)
 
 
 def bool_field(data, field=None, required=True):
@@ -41,10 +44,18 @@ def bool_field(data, field=None, required=True):
     Raise:
         ValidationError: The type of `field` is not bool.
     """
-    field_data = _field(data, field, required)
-    if str(field_data).lower() == "true":
+    field_data = _field(data, field, required) if field else data
+    if field_data is True or field_data is False:
+        return field_data
+    if isinstance(field_data, str):
+        if field_data in _TRUE_STRINGS:
+            return True
+        if field_data in _FALSE_STRINGS:
+            return False
+    value = str(field_data).lower()
+    if value == "true":
         return True
-    if str(field_data).lower() == "false":
+    if value == "false":
         return False
     if not required:
         return None
@@ -66,9 +77,11 @@ def int_field(data, field=None, required=True):
     Raise:
         ValidationError: The type of `field` is not int.
     """
-    field_data = _field(data, field, required)
+    field_data = _field(data, field, required) if field else data
     if not field_data and field_data != 0 and not required:
         return None
+    if type(field_data) is int:  # Already int, e.g. decoded from JSON.
+        return field_data
     try:
         return int(field_data)
     except:
@@ -90,9 +103,11 @@ def float_field(data, field=None, required=True):
     Raise:
         ValidationError: The type of `field` is not float.
     """
-    field_data = _field(data, field, required)
+    field_data = _field(data, field, required) if field else data
     if not field_data and not required:
         return None
+    if type(field_data) is float:  # Already float, e.g. decoded from JSON.
+        return field_data
     try:
         return float(field_data)
     except:
@@ -111,7 +126,7 @@ def string_field(data, field=None, required=True):
         1. String field.
         2. If `field` is not exits and required is False, return None.
     """
-    field_data = _field(data, field, required)
+    field_data = _field(data, field, required) if field else data
     if not field_data:
         return ""
     if not field_data and not required:
@@ -134,7 +149,7 @@ def list_field(data, field=None, required=True):
     Raise:
         ValidationError: The type of `field` is not list.
     """
-    field_data = _field(data, field, required)
+    field_data = _field(data, field, required) if field else data
     if not field_data and not required:
         return None
     if isinstance(field_data, str):
@@ -162,7 +177,7 @@ def dict_field(data, field=None, required=True):
     Raise:
         ValidationError: The type of `field` is not dict.
     """
-    field_data = _field(data, field, required)
+    field_data = _field(data, field, required) if field else data
     if not field_data and not required:
         return None
     if isinstance(field_data, str):
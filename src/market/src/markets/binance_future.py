@@ -32,7 +32,8 @@ class BinanceFuture:
     def __init__(self, **kwargs):
         self._platform = kwargs["platform"]
         self._wss = kwargs.get("wss", "wss://fstream.binance.com:443")
-        self._symbols = list(set(kwargs.get("symbols")))
+        self._symbols = list(dict.fromkeys(kwargs.get("symbols")))
+        self._raw_symbols = {symbol: symbol.replace("/", "").lower() for symbol in self._symbols}  # e.g. btcusdt
         self._channels = kwargs.get("channels")
         self._orderbook_length = kwargs.get("orderbook_length", 20)
 
@@ -94,15 +95,16 @@ class BinanceFuture:
 
     async def process_kline(self, symbol, data):
         """Process kline data and publish KlineEvent."""
+        k = data["k"]
         kline = {
             "platform": self._platform,
             "symbol": symbol,
-            "open": data.get("k").get("o"),
-            "high": data.get("k").get("h"),
-            "low": data.get("k").get("l"),
-            "close": data.get("k").get("c"),
-            "volume": data.get("k").get("q"),
-            "timestamp": data.get("k").get("t"),
+            "open": k.get("o"),
+            "high": k.get("h"),
+            "low": k.get("l"),
+            "close": k.get("c"),
+            "volume": k.get("q"),
+            "timestamp": k.get("t"),
             "kline_type": const.MARKET_TYPE_KLINE
         }
         EventKline(**kline).publish()
@@ -110,12 +112,8 @@ class BinanceFuture:
 
     async def process_orderbook(self, symbol, data):
         """Process orderbook data and publish OrderbookEvent."""
-        bids = []
-        asks = []
-        for bid in data.get("b")[:self._orderbook_length]:
-            bids.append(bid[:2])
-        for ask in data.get("a")[:self._orderbook_length]:
-            asks.append(ask[:2])
+        bids = [bid[:2] for bid in data["b"][:self._orderbook_length]]
+        asks = [ask[:2] for ask in data["a"][:self._orderbook_length]]
         orderbook = {
             "platform": self._platform,
             "symbol": symbol,
@@ -140,6 +138,6 @@ class BinanceFuture:
         logger.info("symbol:", symbol, "trade:", trade, caller=self)
 
     def _symbol_to_channel(self, symbol, channel_type="ticker"):
-        channel = "{x}@{y}".format(x=symbol.replace("/", "").lower(), y=channel_type)
+        channel = self._raw_symbols[symbol] + "@" + channel_type
         self._c_to_s[channel] = symbol
         return channel
@@ -32,7 +32,7 @@ class Bitmex:
     def __init__(self, **kwargs):
         self._platform = kwargs["platform"]
         self._wss = kwargs.get("wss", "wss://www.bitmex.com")
-        self._symbols = list(set(kwargs.get("symbols")))
+        self._symbols = list(dict.fromkeys(kwargs.get("symbols")))
         self._channels = kwargs.get("channels")
 
         self._c_to_s = {}  # {"channel": "symbol"}
@@ -94,50 +94,62 @@ class Bitmex:
 
     async def process_orderbook(self, data):
         """Process orderbook data and publish OrderbookEvent."""
+        platform = self._platform
+        utctime_str_to_mts = tools.utctime_str_to_mts
+        events = []
         for item in data:
             symbol = item.get("symbol")
             orderbook = {
-                "platform": self._platform,
+                "platform": platform,
                 "symbol": symbol,
                 "asks": item.get("asks"),
                 "bids": item.get("bids"),
-                "timestamp": tools.utctime_str_to_mts(item["timestamp"])
+                "timestamp": utctime_str_to_mts(item["timestamp"])
             }
-            EventOrderbook(**orderbook).publish()
+            events.append(EventOrderbook(**orderbook))
             logger.debug("symbol:", symbol, "orderbook:", orderbook, caller=self)
+        EventOrderbook.publish_many(events)
 
     async def process_kline(self, data):
         """Process kline data and publish KlineEvent."""
+        platform = self._platform
+        utctime_str_to_mts = tools.utctime_str_to_mts
+        events = []
         for item in data:
             symbol = item["symbol"]
             kline = {
-                "platform": self._platform,
+                "platform": platform,
                 "symbol": symbol,
                 "open": "%.8f" % item["open"],
                 "high": "%.8f" % item["high"],
                 "low": "%.8f" % item["low"],
                 "close": "%.8f" % item["close"],
                 "volume": str(item["volume"]),
-                "timestamp": tools.utctime_str_to_mts(item["timestamp"]),
+                "timestamp": utctime_str_to_mts(item["timestamp"]),
                 "kline_type": MARKET_TYPE_KLINE
             }
-            EventKline(**kline).publish()
+            events.append(EventKline(**kline))
             logger.debug("symbol:", symbol, "kline:", kline, caller=self)
+        EventKline.publish_many(events)
 
     async def process_trade(self, data):
         """Process trade data and publish TradeEvent."""
+        platform = self._platform
+        utctime_str_to_mts = tools.utctime_str_to_mts
+        events = []
         for item in data:
             symbol = item["symbol"]
             trade = {
-                "platform": self._platform,
+                "platform": platform,
                 "symbol": symbol,
                 "action":  ORDER_ACTION_BUY if item["side"] == "Buy" else ORDER_ACTION_SELL,
                 "price": "%.8f" % item["price"],
                 "quantity": str(item["size"]),
-                "timestamp": tools.utctime_str_to_mts(item["timestamp"])
+                "timestamp": utctime_str_to_mts(item["timestamp"])
             }
-            EventTrade(**trade).publish()
+            events.append(EventTrade(**trade))
             logger.debug("symbol:", symbol, "trade:", trade, caller=self)
+        EventTrade.publish_many(events)
 
     def _symbol_to_channel(self, symbol, channel_type):
         channel = "{channel_type}:{symbol}".format(channel_type=channel_type, symbol=symbol)
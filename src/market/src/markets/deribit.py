@@ -37,7 +37,7 @@ class Deribit:
     def __init__(self, **kwargs):
         self._platform = kwargs["platform"]
         self._wss = None
-        self._symbols = list(set(kwargs.get("symbols")))
+        self._symbols = list(dict.fromkeys(kwargs.get("symbols")))
         self._channels = kwargs.get("channels")
         self._orderbook_length = kwargs.get("orderbook_length", 10)
         self._access_key = None
@@ -123,14 +123,8 @@ class Deribit:
         symbol = data["instrument"]
         if symbol not in self._symbols:
             return
-        bids = []
-        for item in data["bids"][:self._orderbook_length]:
-            b = [item.get("price"), item.get("quantity")]
-            bids.append(b)
-        asks = []
-        for item in data["asks"][:self._orderbook_length]:
-            a = [item.get("price"), item.get("quantity")]
-            asks.append(a)
+        bids = [[item.get("price"), item.get("quantity")] for item in data["bids"][:self._orderbook_length]]
+        asks = [[item.get("price"), item.get("quantity")] for item in data["asks"][:self._orderbook_length]]
         self._last_msg_ts = tools.get_cur_timestamp_ms()
         orderbook = {
             "platform": self._platform,
@@ -163,6 +157,6 @@ class Deribit:
         """ 生成signature
         """
         sign = "_=%s&_ackey=%s&_acsec=%s&_action=%s" % (nonce, access_key, access_secret, uri)
-        for key in sorted(params.keys()):
-            sign += "&" + key + "=" + "".join(params[key])
-        return "%s.%s.%s" % (access_key, nonce, base64.b64encode(hashlib.sha256(sign.encode()).digest()).decode())
+        sign += "".join(["&" + key + "=" + "".join(params[key]) for key in sorted(params)])
+        digest = hashlib.sha256(sign.encode()).digest()
+        return "%s.%s.%s" % (access_key, nonce, base64.b64encode(digest).decode())